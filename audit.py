@@ -0,0 +1,180 @@
+#!env/bin/python
+
+from bluepy import btle
+from concurrent.futures import ThreadPoolExecutor
+from update import Target, Delegate
+import cydfu
+import os
+import sys
+import threading
+
+
+# How long to scan for the targets' address types before auditing
+SCAN_TIME = 5
+
+# Rows checked against each image when --rows is not given (the first and last rows)
+DEFAULT_ROWS = [1, -1]
+
+# Many kernels allow only one pending LE connection per controller, so connect
+# one target at a time and only run the DFU commands concurrently
+_connectLock = threading.Lock()
+
+
+def parseRows(spec):
+    """Parse a comma separated list of row numbers. Negative numbers count from the last row."""
+    if spec == 'all':
+        return 'all'
+    if spec == 'none':
+        return []
+    rows = [int(row) for row in spec.split(',')]
+    if 0 in rows:
+        raise ValueError("Row numbers start at 1")
+    return rows
+
+
+def resolveRows(rows, app):
+    """Turn row numbers into rows counted from 1, checking that each one is in the image."""
+    if rows == 'all':
+        return list(range(1, app.numRows + 1))
+
+    resolved = []
+    for row in rows:
+        if abs(row) > app.numRows:
+            raise IndexError(f"Row {row} is not in the application (1 to {app.numRows}, or -1 to -{app.numRows})")
+        resolved.append(row if row > 0 else app.numRows + 1 + row)
+
+    # Remove duplicates, e.g. the first and last rows of a one row image
+    return list(dict.fromkeys(resolved))
+
+
+def auditDevice(addr, addrType, apps, appRows):
+    """Audit one device and return [addr, dfuInfo, results, error]."""
+    target = None
+    try:
+        with _connectLock:
+            target = Target(addr, addrType).withDelegate(Delegate())
+        dfuInfo, results = target.auditFirmware(apps, appRows)
+    except Exception as e:
+        return [addr, None, None, str(e) or type(e).__name__]
+    finally:
+        if target != None:
+            try:
+                target.disconnect()
+            except Exception:
+                pass
+    return [addr, dfuInfo, results, None]
+
+
+def printReport(report, appNames, checkedRows):
+    """Display the report as a table. Returns True if every device matched an image.
+
+    Without checked rows, Verify Application only proves that an application slot
+    holds a valid application, not which image it is, so such devices are reported
+    as VALID rather than matched.
+    """
+    print(f" {'MAC ADDRESS':^17} | {'JTAG ID':^10} | {'Rev':^4} | {'DFU SDK':^10} | {'Result':^10} | Image")
+    print('-' * 19 + '+' + '-' * 12 + '+' + '-' * 6 + '+' + '-' * 12 + '+' + '-' * 12 + '+' + '-' * 20)
+
+    allMatched = True
+    for addr, dfuInfo, results, error in report:
+        if error != None:
+            result, detail = "ERROR", error
+        else:
+            matched = [name for name, (valid, rowsMatch) in zip(appNames, results) if rowsMatch]
+
+            if matched:
+                result, detail = "MATCH", ", ".join(matched)
+            elif any(valid for valid, rowsMatch in results) and not checkedRows:
+                result, detail = "VALID", "Application is valid (no rows checked)"
+            elif any(valid for valid, rowsMatch in results):
+                result, detail = "MISMATCH", "Application is valid but does not match any image"
+            else:
+                result, detail = "NOT VALID", "Application checksum is not valid"
+
+        if result != "MATCH":
+            allMatched = False
+        if dfuInfo != None:
+            jtagID, deviceRev, dfuSdkVer = dfuInfo
+            dfuInfo = f"0x{jtagID:08x} | 0x{deviceRev:02x} | 0x{dfuSdkVer:08x}"
+        else:
+            dfuInfo = f"{'-':^10} | {'-':^4} | {'-':^10}"
+        print(f" {addr:^17} | {dfuInfo} | {result:^10} | {detail}")
+
+    return allMatched
+
+
+if __name__ == '__main__':
+    usageStatement = (
+        "Usage: audit.py [--rows=N,N,...|--rows=all|--rows=none] [--jobs=N] application_file [...] target_MAC_address [...]\n"
+        "       Row numbers start at 1. Negative row numbers count back from the last row.\n"
+        "       The first and last rows are checked by default."
+    )
+
+    # Sort the command line arguments into options, image files, and targets
+    rows = DEFAULT_ROWS
+    jobs = 4
+    files = []
+    addrs = []
+    try:
+        for arg in sys.argv[1:]:
+            if arg.startswith('--rows='):
+                rows = parseRows(arg[len('--rows='):])
+            elif arg.startswith('--jobs='):
+                jobs = int(arg[len('--jobs='):])
+            elif arg.endswith('.cyacd2'):
+                files.append(arg)
+            else:
+                addrs.append(arg.lower())
+    except ValueError:
+        print(usageStatement)
+        raise SystemExit
+
+    if (files == []) or (addrs == []) or (jobs < 1):
+        print(usageStatement)
+        raise SystemExit
+
+    # Load every image into memory so rows can be read in any order
+    apps = []
+    for file in files:
+        try:
+            apps.append(cydfu.CachedApplication(file))
+        except FileNotFoundError:
+            print(f"{file} does not exist.")
+            raise SystemExit
+        print(f"Opened application image file \"{file}\" (App ID {apps[-1].appID}, {apps[-1].numRows} rows)")
+
+    if any(app.productID != apps[0].productID for app in apps):
+        print("All application images must have the same product ID.")
+        raise SystemExit
+
+    # Check the requested rows exist in every image
+    try:
+        appRows = [resolveRows(rows, app) for app in apps]
+    except IndexError as e:
+        print(e.args[0])
+        raise SystemExit
+
+    print()
+
+    # Scan briefly to learn each target's address type
+    print(f"Scanning for {len(addrs)} target(s)...")
+    addrTypes = {}
+    try:
+        for device in btle.Scanner().scan(SCAN_TIME):
+            addrTypes[device.addr] = device.addrType
+    except Exception as e:
+        print(f"Error scanning for devices: {e}")
+    for addr in addrs:
+        if addr not in addrTypes:
+            print(f"> {addr} was not seen, assuming a public address.")
+
+    # Audit the targets concurrently
+    print(f"Auditing {len(addrs)} target(s)...\n")
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        report = list(executor.map(
+            lambda addr: auditDevice(addr, addrTypes.get(addr, btle.ADDR_TYPE_PUBLIC), apps, appRows),
+            addrs))
+    print()
+
+    if not printReport(report, [os.path.basename(file) for file in files], rows != []):
+        raise SystemExit(1)
@@ -89,19 +89,16 @@ class DFUProtocol:
 
 
     def enterDFU(self, productID = 0):
-        """Begin a DFU operation"""
+        """Begin a DFU operation. Returns [jtagID, deviceRev, dfuSdkVer]."""
         # Create the packet payload
         payload = struct.pack("<I", productID)
         
         # Send the Enter DFU command and get the response
         respData = self._sendCommandGetResponse(self._CMD_ENTER_DFU, payload, 2)
 
-        # Parse reponse packet payload and print data fields
+        # Parse and return the reponse packet payload data fields
         jtagID, deviceRev, dfuSdkVer = struct.unpack("<IBI", respData[:5] + b'\x00' + respData[5:])
-        print("Enter DFU successful.")
-        print(f"> JTAG ID: 0x{jtagID:08x}")
-        print(f"> Device Revision 0x{deviceRev:02x}")
-        print(f"> DFU SDK Version 0x{dfuSdkVer:08x}")
+        return [jtagID, deviceRev, dfuSdkVer]
 
     
     def syncDFU(self):
@@ -341,11 +338,14 @@ class Application:
         # Save the current stream position
         prevPos = self._app.tell()
 
-        # Seek to the beginning of the file and count the number of lines
+        # Seek to the beginning of the file and count the number of non-blank lines
         self._app.seek(0)
         lineCount = 0
-        while self._app.readline():
-            lineCount += 1
+        line = self._app.readline()
+        while line:
+            if line.strip() != '':
+                lineCount += 1
+            line = self._app.readline()
 
         # Return to the original stream position
         self._app.seek(prevPos)
@@ -387,8 +387,10 @@ class Application:
         self.length = int(self.length, 0)
 
     def getNextRow(self):
-        # Read row
+        # Read row, skipping blank lines (e.g. a trailing newline at the end of the file)
         row = next(self._app)
+        while row.strip() == '':
+            row = next(self._app)
 
         # Verify row header
         if row[0] != ':':
@@ -407,5 +409,72 @@ class Application:
         self._app.close()
 
 
+class CachedApplication:
+    """Holds a fully parsed cyacd2 file in memory so it can be replayed by many DFU operations"""
+
+    def __init__(self, cyacd2_file):
+        """Parses the cyacd2 file provided, keeps its header info and all of its
+           data rows, then closes the file"""
+        app = Application(cyacd2_file)
+        try:
+            # Copy the header and application verification information
+            self.fileVersion = app.fileVersion
+            self.siliconID = app.siliconID
+            self.siliconRevision = app.siliconRevision
+            self.checksumType = app.checksumType
+            self.appID = app.appID
+            self.productID = app.productID
+            self.startAddr = app.startAddr
+            self.length = app.length
+
+            # Read every data row
+            self.rows = []
+            while True:
+                try:
+                    self.rows.append(app.getNextRow())
+                except StopIteration:
+                    break
+        finally:
+            app.close()
+
+        self.numRows = len(self.rows)
+
+    def getRow(self, rowNum):
+        """Returns [rowAddr, rowData] for a row number, counting from 1 like Application.currRow"""
+        if (rowNum < 1) or (rowNum > self.numRows):
+            raise IndexError(f"Row {rowNum} is not in the application (1-{self.numRows})")
+        return self.rows[rowNum - 1]
+
+
+class ApplicationReader:
+    """Reads the rows of a CachedApplication one at a time, like Application does for a file"""
+
+    def __init__(self, cachedApp):
+        self._cachedApp = cachedApp
+
+        # Copy the header and application verification information
+        self.fileVersion = cachedApp.fileVersion
+        self.siliconID = cachedApp.siliconID
+        self.siliconRevision = cachedApp.siliconRevision
+        self.checksumType = cachedApp.checksumType
+        self.appID = cachedApp.appID
+        self.productID = cachedApp.productID
+        self.startAddr = cachedApp.startAddr
+        self.length = cachedApp.length
+        self.numRows = cachedApp.numRows
+
+        # Initialize currRow counter
+        self.currRow = 0
+
+    def getNextRow(self):
+        if self.currRow >= self.numRows:
+            raise StopIteration
+        self.currRow += 1
+        return self._cachedApp.rows[self.currRow - 1]
+
+    def close(self):
+        pass
+
+
 if __name__ == "__main__":
     pass
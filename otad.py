@@ -0,0 +1,422 @@
+#!env/bin/python
+
+from bluepy import btle
+from update import Target, Delegate
+import cydfu
+import itertools
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+import queue
+
+
+# The daemon runs as root for scanning, so keep its socket out of world-writable directories
+SOCKET_PATH = os.environ.get("OTAD_SOCKET", "/run/otad.sock")
+
+# Devices not seen by a background scan for this many seconds are forgotten
+DEVICE_MAX_AGE = 60
+
+# Only this many finished jobs are kept for status queries
+MAX_FINISHED_JOBS = 100
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class _JobReader(cydfu.ApplicationReader):
+    """Application reader that stops the DFU operation when its job is cancelled"""
+
+    def __init__(self, cachedApp, cancelEvent):
+        super().__init__(cachedApp)
+        self._cancelEvent = cancelEvent
+
+    def getNextRow(self):
+        if self._cancelEvent.is_set():
+            raise JobCancelled()
+        return super().getNextRow()
+
+
+class Job():
+    def __init__(self, jobID, imagePath, cachedApp, addr):
+        self.jobID = jobID
+        self.imagePath = imagePath
+        self.addr = addr
+        self.state = 'queued'
+        self.valid = None
+        self.message = ''
+        self.cancelEvent = threading.Event()
+        self.app = _JobReader(cachedApp, self.cancelEvent)
+
+    def status(self):
+        return {
+            'job': self.jobID,
+            'image': self.imagePath,
+            'target': self.addr,
+            'state': self.state,
+            'row': self.app.currRow,
+            'rows': self.app.numRows,
+            'valid': self.valid,
+            'message': self.message,
+        }
+
+
+class Adapter():
+    """An HCI adapter that is kept scanning in the background between jobs."""
+
+    def __init__(self, iface):
+        self.iface = iface
+        self.lock = threading.Lock()
+        self.devices = {}
+        self.lastSeen = {}
+        self._scanner = btle.Scanner(iface)
+        self._scanning = False
+        self._stopEvent = threading.Event()
+        self._scanThread = threading.Thread(target=self._scanLoop, daemon=True)
+
+    def start(self):
+        self._scanThread.start()
+
+    def stop(self):
+        self._stopEvent.set()
+        with self.lock:
+            self.pauseScanning()
+
+    def pauseScanning(self):
+        """Stop the scanner so the adapter is free to connect. Must hold self.lock.
+
+        The scan thread restarts the scanner once the lock is released.
+        """
+        if self._scanning:
+            try:
+                self._scanner.stop()
+            except Exception:
+                print(f"hci{self.iface}: Error stopping scanner.")
+            self._scanning = False
+
+    def _scanLoop(self):
+        while not self._stopEvent.is_set():
+            try:
+                with self.lock:
+                    if not self._scanning:
+                        self._scanner.clear()
+                        self._scanner.start()
+                        self._scanning = True
+                    self._scanner.process(0.5)
+
+                    # Index the devices heard during this pass
+                    now = time.time()
+                    for device in self._scanner.getDevices():
+                        self.devices[device.addr] = device
+                        self.lastSeen[device.addr] = now
+                    self._scanner.clear()
+
+                    # Forget devices that have not been heard from recently
+                    for addr in [addr for addr, seen in self.lastSeen.items() if now - seen > DEVICE_MAX_AGE]:
+                        del self.devices[addr]
+                        del self.lastSeen[addr]
+            except Exception as e:
+                print(f"hci{self.iface}: Scan error: {e}")
+                self._scanning = False
+                time.sleep(1)
+
+
+class OTADaemon():
+    """Runs DFU jobs using warm adapters and cached application images."""
+
+    def __init__(self, ifaces=(0,)):
+        self.adapters = [Adapter(iface) for iface in ifaces]
+        self._lock = threading.Lock()
+        self._images = {}
+        self._jobs = {}
+        self._jobIDs = itertools.count(1)
+        self._jobQueue = queue.Queue()
+
+    def start(self):
+        for adapter in self.adapters:
+            adapter.start()
+            threading.Thread(target=self._worker, args=(adapter,), daemon=True).start()
+
+    def stop(self):
+        for adapter in self.adapters:
+            adapter.stop()
+
+    def loadImage(self, path):
+        """Get a parsed application image, re-reading the file only if it changed."""
+        path = os.path.abspath(path)
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            cached = self._images.get(path)
+            if (cached != None) and (cached[0] == mtime):
+                return cached[1]
+
+        cachedApp = cydfu.CachedApplication(path)
+        with self._lock:
+            self._images[path] = (mtime, cachedApp)
+        print(f"Loaded application image \"{path}\" (App ID {cachedApp.appID}, {cachedApp.numRows} rows)")
+        return cachedApp
+
+    def submit(self, imagePath, addr):
+        cachedApp = self.loadImage(imagePath)
+        with self._lock:
+            job = Job(next(self._jobIDs), os.path.abspath(imagePath), cachedApp, addr.lower())
+            self._jobs[job.jobID] = job
+        self._jobQueue.put(job)
+        print(f"[job {job.jobID}] Queued update of {job.addr}")
+        return job.jobID
+
+    def cancel(self, jobID):
+        with self._lock:
+            job = self._getJob(jobID)
+            if job.state == 'queued':
+                job.state = 'cancelled'
+                self._pruneJobs()
+            elif job.state == 'running':
+                job.cancelEvent.set()
+                job.message = 'cancelling'
+            else:
+                raise ValueError(f"Job {jobID} has already finished")
+
+    def status(self, jobID=None):
+        with self._lock:
+            if jobID != None:
+                return [self._getJob(jobID).status()]
+            return [job.status() for job in self._jobs.values()]
+
+    def devices(self):
+        now = time.time()
+        seen = {}
+        for adapter in self.adapters:
+            for addr, device in list(adapter.devices.items()):
+                # The scan thread may forget the device while this runs
+                lastSeen = adapter.lastSeen.get(addr)
+                if lastSeen == None:
+                    continue
+                age = now - lastSeen
+                if age > DEVICE_MAX_AGE:
+                    continue
+                if (addr not in seen) or (age < seen[addr]['age']):
+                    seen[addr] = {
+                        'addr': addr,
+                        'name': device.getValueText(9),
+                        'rssi': device.rssi,
+                        'iface': adapter.iface,
+                        'age': round(age, 1),
+                    }
+        return sorted(seen.values(), key=lambda d: d['rssi'], reverse=True)
+
+    def handleRequest(self, request):
+        """Run a control API request and return the response to send back."""
+        try:
+            cmd = request.get('cmd')
+            if cmd == 'submit':
+                return {'ok': True, 'job': self.submit(request['image'], request['target'])}
+            elif cmd == 'status':
+                return {'ok': True, 'jobs': self.status(request.get('job'))}
+            elif cmd == 'cancel':
+                self.cancel(request['job'])
+                return {'ok': True}
+            elif cmd == 'devices':
+                return {'ok': True, 'devices': self.devices()}
+            else:
+                return {'ok': False, 'error': f"Unknown command \"{cmd}\""}
+        except KeyError as e:
+            return {'ok': False, 'error': f"Missing field {e}"}
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}
+
+    def _getJob(self, jobID):
+        try:
+            return self._jobs[int(jobID)]
+        except (KeyError, ValueError):
+            raise ValueError(f"Job {jobID} does not exist")
+
+    def _pruneJobs(self):
+        """Forget the oldest finished jobs. Must hold self._lock."""
+        finished = [jobID for jobID, job in self._jobs.items() if job.state in ('done', 'failed', 'cancelled')]
+        for jobID in finished[:-MAX_FINISHED_JOBS]:
+            del self._jobs[jobID]
+
+    def _worker(self, adapter):
+        while True:
+            job = self._jobQueue.get()
+            with self._lock:
+                if job.state != 'queued': # Cancelled while waiting
+                    continue
+                job.state = 'running'
+
+            with adapter.lock:
+                adapter.pauseScanning()
+                self._runJob(job, adapter)
+
+    def _runJob(self, job, adapter):
+        print(f"[job {job.jobID}] Updating {job.addr} using hci{adapter.iface}")
+        target = None
+        try:
+            target = self._connect(job.addr, adapter)
+
+            # Don't enter DFU at all if the job was cancelled while connecting
+            if job.cancelEvent.is_set():
+                raise JobCancelled()
+            job.valid = target.updateFirmware(job.app)
+            state = 'done'
+        except JobCancelled:
+            state = 'cancelled'
+        except Exception as e:
+            state = 'failed'
+            job.message = str(e)
+        finally:
+            if target != None:
+                try:
+                    target.disconnect()
+                except Exception:
+                    pass
+
+        with self._lock:
+            job.state = state
+            self._pruneJobs()
+        print(f"[job {job.jobID}] {state}")
+
+    def _connect(self, addr, adapter):
+        # Use the scan entry from this adapter so the address type is already known
+        device = adapter.devices.get(addr)
+        if device != None:
+            return Target(device).withDelegate(Delegate())
+
+        # Otherwise take the address type from any adapter that has seen the device
+        addrType = btle.ADDR_TYPE_PUBLIC
+        for other in self.adapters:
+            if addr in other.devices:
+                addrType = other.devices[addr].addrType
+        return Target(addr, addrType, adapter.iface).withDelegate(Delegate())
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Handles one JSON request per line and replies with one JSON response per line."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                response = {'ok': False, 'error': "Malformed request"}
+            else:
+                response = self.server.otad.handleRequest(request)
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class _ControlServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, otad):
+        self.otad = otad
+        super().__init__(path, _RequestHandler)
+
+
+def sendRequest(request, path=SOCKET_PATH):
+    """Send a request to a running daemon and return its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('rb') as f:
+            return json.loads(f.readline())
+
+
+def serve(ifaces, path=SOCKET_PATH):
+    otad = OTADaemon(ifaces)
+
+    # Refuse to take the socket from a daemon that is still running, or to
+    # replace something that is not a socket at all
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            print(f"{path} exists and is not a socket.")
+            raise SystemExit(1)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(path)
+            except ConnectionRefusedError:
+                # Left behind by a daemon that is no longer running
+                os.unlink(path)
+            else:
+                print(f"A daemon is already listening on {path}.")
+                raise SystemExit(1)
+
+    server = _ControlServer(path, otad)
+    otad.start()
+    print(f"Listening on {path} using " + ", ".join(f"hci{iface}" for iface in ifaces))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        otad.stop()
+        os.unlink(path)
+        print("Daemon stopped.")
+
+
+def _printJob(job):
+    line = f"Job {job['job']}: {job['state']:<9} {job['target']}  row {job['row']}/{job['rows']}  {job['image']}"
+    if job['valid'] != None:
+        line += "  (valid)" if job['valid'] else "  (NOT valid)"
+    if job['message']:
+        line += f"  {job['message']}"
+    print(line)
+
+
+if __name__ == '__main__':
+    usageStatement = (
+        "Usage: otad.py serve [hci_index ...]\n"
+        "       otad.py submit application_file target_MAC_address\n"
+        "       otad.py status [job_id]\n"
+        "       otad.py cancel job_id\n"
+        "       otad.py devices"
+    )
+    args = sys.argv[1:]
+    cmd = args[0] if args else None
+
+    if cmd == 'serve':
+        try:
+            ifaces = [int(iface) for iface in args[1:]] or [0]
+        except ValueError:
+            print(usageStatement)
+            raise SystemExit
+        serve(ifaces)
+        raise SystemExit
+
+    if (cmd == 'submit') and (len(args) == 3):
+        request = {'cmd': 'submit', 'image': os.path.abspath(args[1]), 'target': args[2]}
+    elif (cmd == 'status') and (len(args) <= 2):
+        request = {'cmd': 'status', 'job': args[1] if len(args) == 2 else None}
+    elif (cmd == 'cancel') and (len(args) == 2):
+        request = {'cmd': 'cancel', 'job': args[1]}
+    elif (cmd == 'devices') and (len(args) == 1):
+        request = {'cmd': 'devices'}
+    else:
+        print(usageStatement)
+        raise SystemExit
+
+    try:
+        response = sendRequest(request)
+    except OSError as e:
+        print(f"Could not reach the daemon at {SOCKET_PATH}: {e}")
+        raise SystemExit
+
+    if not response['ok']:
+        print(response['error'])
+        raise SystemExit(1)
+
+    if cmd == 'submit':
+        print(f"Submitted job {response['job']}.")
+    elif cmd == 'status':
+        for job in response['jobs']:
+            _printJob(job)
+    elif cmd == 'devices':
+        for device in response['devices']:
+            print(f"{device['addr']}  {device['rssi']:>4} dB  hci{device['iface']}  {device['name'] or '<No Name>'}")
@@ -151,48 +151,106 @@ class Target(btle.Peripheral):
 
         # Send the Enter DFU command
         print("Starting DFU operation...")
-        hostCmd.enterDFU(app.productID)
+        jtagID, deviceRev, dfuSdkVer = hostCmd.enterDFU(app.productID)
+        print("Enter DFU successful.")
+        print(f"> JTAG ID: 0x{jtagID:08x}")
+        print(f"> Device Revision 0x{deviceRev:02x}")
+        print(f"> DFU SDK Version 0x{dfuSdkVer:08x}")
         print(f"> Product ID: 0x{app.productID:08X}\n")
 
-        # Set Application Metadata
-        hostCmd.setApplicationMetadata(app.appID, app.startAddr, app.length)
-        print(f"Application {app.appID} is {app.length} bytes long. Will begin writing at memory address 0x{app.startAddr:08X}.\n")
-
-        # Send row data to target
-        print("Sending Data...")
-        while True:
-            try:
-                rowAddr, rowData = app.getNextRow()
-            except Exception:
-                break
-
-            # Calculate the CRC-32C checksum of the row data
-            crc = crc32cFunc(rowData)
-
-            # Break the row data into smaller chunks of size maxDataLength
-            rowData = [rowData[i:i+maxDataLength] for i in range(0, len(rowData), maxDataLength)]
-
-            # Send all but the last chunk using the Send Data command
-            for chunk in rowData[:-1]:
-                hostCmd.sendData(chunk)
-
-            # Send the last chunk using the Program Data command
-            hostCmd.programData(rowAddr, crc, rowData[-1])
-            print(f"> Sent Data Row {app.currRow}/{app.numRows}")
+        try:
+            # Set Application Metadata
+            hostCmd.setApplicationMetadata(app.appID, app.startAddr, app.length)
+            print(f"Application {app.appID} is {app.length} bytes long. Will begin writing at memory address 0x{app.startAddr:08X}.\n")
 
-        print("Finished sending application to target.\n")
+            # Send row data to target
+            print("Sending Data...")
+            while True:
+                try:
+                    rowAddr, rowData = app.getNextRow()
+                except StopIteration:
+                    break
+
+                # Calculate the CRC-32C checksum of the row data
+                crc = crc32cFunc(rowData)
+
+                # Break the row data into smaller chunks of size maxDataLength
+                rowData = [rowData[i:i+maxDataLength] for i in range(0, len(rowData), maxDataLength)]
+
+                # Send all but the last chunk using the Send Data command
+                for chunk in rowData[:-1]:
+                    hostCmd.sendData(chunk)
+
+                # Send the last chunk using the Program Data command
+                hostCmd.programData(rowAddr, crc, rowData[-1])
+                print(f"> Sent Data Row {app.currRow}/{app.numRows}")
+
+            print("Finished sending application to target.\n")
+
+            # Send Verify Application command
+            print("Verifying Application...")
+            result = hostCmd.verifyApplication(app.appID)
+            if result == 1:
+                print("> The application is valid!")
+            else:
+                print("> The application is NOT valid.")
+        finally:
+            # Send the Exit DFU command, even if the DFU operation failed
+            print("Ending DFU operation.")
+            hostCmd.exitDFU()
+
+        return result == 1
+
+
+    def auditFirmware(self, apps, appRows=None, maxDataLength=512):
+        """Check the target's firmware against one or more applications without programming it.
+
+        All apps must share the same product ID. appRows optionally holds a list
+        of row numbers to check for each app, numbered from 1 like
+        Application.currRow. Returns [dfuInfo, results], where dfuInfo is the
+        [jtagID, deviceRev, dfuSdkVer] reported by Enter DFU and results has one
+        [valid, rowsMatch] entry per app, with rowsMatch None if no rows were
+        checked. Nothing is printed, so targets can be audited concurrently.
+        """
+        if appRows == None:
+            appRows = [[] for app in apps]
 
-        # Send Verify Application command
-        print("Verifying Application...")
-        result = hostCmd.verifyApplication(fwImg.appID)
-        if result == 1:
-            print("> The application is valid!")
-        else:
-            print("> The application is NOT valid.")
+        crc32cFunc = crcmod.predefined.mkCrcFun('crc-32c')
+        hostCmd = cydfu.DFUProtocol(self)
 
-        # Send the Exit DFU command
-        print("Ending DFU operation.")
-        hostCmd.exitDFU()
+        dfuInfo = hostCmd.enterDFU(apps[0].productID)
+        try:
+            # Verify each application slot only once
+            valid = {}
+            for app in apps:
+                if app.appID not in valid:
+                    valid[app.appID] = (hostCmd.verifyApplication(app.appID) == 1)
+
+            results = []
+            for app, rowNums in zip(apps, appRows):
+                rowsMatch = None
+                if rowNums and valid[app.appID]:
+                    rowsMatch = True
+                    for rowNum in rowNums:
+                        rowAddr, rowData = app.getRow(rowNum)
+                        crc = crc32cFunc(rowData)
+
+                        # Stream all but the last chunk without waiting for responses
+                        rowData = [rowData[i:i+maxDataLength] for i in range(0, len(rowData), maxDataLength)]
+                        for chunk in rowData[:-1]:
+                            hostCmd.sendDataWithoutResponse(chunk)
+
+                        try:
+                            hostCmd.verifyData(rowAddr, crc, rowData[-1])
+                        except cydfu.DFUErrorVerify:
+                            rowsMatch = False
+                            break
+                results.append([valid[app.appID], rowsMatch])
+        finally:
+            # Leave the bootloader without programming anything
+            hostCmd.exitDFU()
+
+        return [dfuInfo, results]
 
 
     def eraseFirmware(self, appNum):